@@ -56,6 +56,18 @@ def format_item_name_pt(item_id):
     final_name = f"{base_name} {tier}{enchant}".strip()
     return final_name if base_name else item_id
 
+# --- Helpers: Cálculo ---
+@st.cache_data(show_spinner=False)
+def cached_sweep(prices_df, fee_values, transport_values, min_profit_pct, cross_quality):
+    # Streamlit reexecuta o script a cada widget; só recalcula a grade se as entradas mudarem
+    return arbitrage.sweep_arbitrage(
+        prices_df,
+        fee_values=list(fee_values),
+        transport_values=list(transport_values),
+        min_profit_pct=min_profit_pct,
+        cross_quality=cross_quality
+    )
+
 # ==========================================
 # BARRA LATERAL (FILTROS E CONTROLES)
 # ==========================================
@@ -118,6 +130,12 @@ with st.sidebar.expander("💰 Taxas e Lucro", expanded=False):
     min_profit_pct = st.slider("Lucro Mínimo (ROI %)", 0, 200, 10)
     arb_method = st.radio("Estratégia", ["Venda Lenta (Sell Order)", "Venda Imediata (Buy Order)"])
     method_code = 'sell_order' if "Lenta" in arb_method else 'instant'
+    cross_quality = st.checkbox(
+        "Vender p/ Buy Order de qualidade inferior",
+        value=False,
+        disabled=(method_code != 'instant'),
+        help="Ex: item Q3 comprado pode preencher Buy Orders Q1/Q2 (ex: Mercado Negro)."
+    )
 
 # ==========================================
 # ÁREA PRINCIPAL (MAIN)
@@ -153,7 +171,8 @@ else:
         fee_pct=fee_pct,
         transport_cost=transport_cost,
         top_n=300,
-        method=method_code 
+        method=method_code,
+        cross_quality=cross_quality
     )
 
     if opportunities_df.empty:
@@ -204,9 +223,14 @@ else:
             display_df['Compra'] = display_df['buy_price'].map('{:,.0f}'.format)
             display_df['Venda'] = display_df['sell_price'].map('{:,.0f}'.format)
             display_df['Item'] = display_df['item_id_quality'].apply(lambda x: format_item_name_pt(x.split('_Q')[0]))
+            display_df['Qualidade'] = display_df['item_id_quality'].apply(lambda x: format_quality_name(x.rsplit('_Q', 1)[-1]))
             
-            # Colunas dinâmicas (dependendo se volume existe ou não)
-            cols = ['Item', 'buy_city', 'sell_city', 'Compra', 'Venda', 'Lucro', 'ROI']
+            # Colunas dinâmicas (dependendo se volume/qualidade da ordem existem ou não)
+            cols = ['Item', 'Qualidade', 'buy_city', 'sell_city', 'Compra', 'Venda', 'Lucro', 'ROI']
+            if 'sell_quality' in display_df.columns:
+                # Cross-quality: qualidade da Buy Order a preencher no destino
+                display_df['Qual. Ordem'] = display_df['sell_quality'].apply(format_quality_name)
+                cols.insert(2, 'Qual. Ordem')
             if 'Volume/Dia' in display_df.columns:
                 cols.extend(['Volume/Dia', 'Liq.'])
             
@@ -214,4 +238,41 @@ else:
                 display_df[cols].rename(columns={'buy_city': 'Origem', 'sell_city': 'Destino'}),
                 use_container_width=True,
                 hide_index=True
-            )
\ No newline at end of file
+            )
+
+# 4. Análise de Sensibilidade (Taxa x Transporte x Estratégia)
+if not all_prices_df.empty:
+    with st.expander("🔬 Sensibilidade (Taxa x Transporte)", expanded=False):
+        col_fee, col_tr = st.columns(2)
+        fee_options = sorted({2.5, 4.5, 6.5, 8.0, 10.5, float(fee_pct)})
+        sweep_fees = col_fee.multiselect("Taxas (%)", fee_options, default=sorted({float(fee_pct), 10.5}))
+        transport_options = sorted({0, 500, 1000, 2000, 5000, int(transport_cost)})
+        sweep_transports = col_tr.multiselect("Transporte", transport_options, default=sorted({0, int(transport_cost), 2000}))
+
+        if st.checkbox("Calcular grade") and sweep_fees and sweep_transports:
+            # Uma única leitura dos dados para todas as combinações
+            sweep_df = cached_sweep(
+                all_prices_df,
+                tuple(sorted(sweep_fees)),
+                tuple(sorted(sweep_transports)),
+                min_profit_pct,
+                cross_quality
+            )
+
+            if sweep_df.empty:
+                st.info("Sem dados válidos para a análise.")
+            else:
+                for method, label in [('sell_order', "Venda Lenta (Sell Order)"), ('instant', "Venda Imediata (Buy Order)")]:
+                    grid = sweep_df[sweep_df['method'] == method]
+                    st.markdown(f"**{label}** (linhas: taxa %, colunas: transporte)")
+                    c_count, c_best = st.columns(2)
+                    c_count.caption("Oportunidades")
+                    c_count.dataframe(
+                        grid.pivot(index='fee_pct', columns='transport_cost', values='opportunities'),
+                        use_container_width=True
+                    )
+                    c_best.caption("Melhor Lucro")
+                    c_best.dataframe(
+                        grid.pivot(index='fee_pct', columns='transport_cost', values='best_net_profit').round(0),
+                        use_container_width=True
+                    )
@@ -1,14 +1,25 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timezone
 
-def find_arbitrage(df_prices: pd.DataFrame, fee_pct: float, transport_cost: int = 0, top_n: int = 50, method: str = 'sell_order') -> pd.DataFrame:
+MAX_AGE_HOURS = 72.0
+
+# Limite de células (linhas x taxas x transportes) avaliadas por bloco no sweep
+SWEEP_CHUNK_CELLS = 2_000_000
+
+def compute_confidence(timestamps: pd.Series, now: datetime) -> pd.Series:
     """
-    Calcula arbitragem com duas estratégias de venda.
-    method: 'instant' (Vende para Buy Order) ou 'sell_order' (Coloca Sell Order).
+    Confiança de 1 (dado recém-coletado) a 0 (mais velho que MAX_AGE_HOURS).
     """
-    if df_prices.empty:
-        return pd.DataFrame()
+    age_hours = (now - timestamps).dt.total_seconds() / 3600
+    return (1.0 - (age_hours / MAX_AGE_HOURS)).clip(0, 1)
 
+def _prepare_prices(df_prices: pd.DataFrame, as_of: datetime | None = None) -> pd.DataFrame:
+    """
+    Tipagem, limpeza e confiança. Independe de taxa, transporte e estratégia,
+    por isso pode ser compartilhada entre vários cálculos (ver sweep_arbitrage).
+    as_of: momento de referência da confiança (padrão: agora).
+    """
     # 1. Preparação e Tipagem
     df = df_prices.copy()
     cols_num = ['sell_price_min', 'buy_price_max']
@@ -27,26 +38,23 @@ def find_arbitrage(df_prices: pd.DataFrame, fee_pct: float, transport_cost: int
     df = df[df['sell_price_min'] > 0]
 
     if df.empty:
-        return pd.DataFrame()
+        return df
 
-    # 2. Confiança
-    now_utc = datetime.now(timezone.utc)
-    MAX_AGE_HOURS = 72.0 
+    # 2. Confiança (uma por timestamp; cada estratégia escolhe a sua)
+    now_utc = as_of if as_of is not None else datetime.now(timezone.utc)
 
-    df['age_hours_buy'] = (now_utc - df['timestamp_sell_min']).dt.total_seconds() / 3600
-    df['confidence_buy'] = (1.0 - (df['age_hours_buy'] / MAX_AGE_HOURS)).clip(0, 1)
-    
-    # Para venda, a confiança depende do método
-    if method == 'instant':
-        df['age_hours_sell'] = (now_utc - df['timestamp_buy_max']).dt.total_seconds() / 3600
-    else:
-        # Se for vender como Sell Order, a recência do Sell Price também importa
-        df['age_hours_sell'] = (now_utc - df['timestamp_sell_min']).dt.total_seconds() / 3600
-        
-    df['confidence_sell'] = (1.0 - (df['age_hours_sell'] / MAX_AGE_HOURS)).clip(0, 1)
+    for col in cols_time:
+        df[col.replace('timestamp', 'confidence')] = compute_confidence(df[col], now_utc)
 
     df['item_key'] = df['item_id'] + '_Q' + df['quality'].astype(str)
 
+    return df
+
+def _join_sides(df: pd.DataFrame, method: str, cross_quality: bool = False) -> pd.DataFrame:
+    """
+    Monta os lados de compra e venda e faz o cruzamento entre cidades.
+    Recebe a saída de _prepare_prices.
+    """
     # 3. Definição dos Lados (Compra vs Venda)
     
     # LADO A: COMPRA (Sempre compramos da Sell Order mais barata)
@@ -54,8 +62,8 @@ def find_arbitrage(df_prices: pd.DataFrame, fee_pct: float, transport_cost: int
         'city': 'buy_city',
         'sell_price_min': 'buy_price',
         'timestamp_sell_min': 'timestamp_buy',
-        'confidence_buy': 'confidence_buy'
-    })[['item_key', 'buy_city', 'buy_price', 'timestamp_buy', 'confidence_buy']]
+        'confidence_sell_min': 'confidence_buy'
+    })[['item_key', 'item_id', 'quality', 'buy_city', 'buy_price', 'timestamp_buy', 'confidence_buy']]
 
     # LADO B: VENDA (Depende da Estratégia)
     if method == 'instant':
@@ -64,27 +72,90 @@ def find_arbitrage(df_prices: pd.DataFrame, fee_pct: float, transport_cost: int
             'city': 'sell_city',
             'buy_price_max': 'sell_price', # Vende pelo preço que estão pagando
             'timestamp_buy_max': 'timestamp_sell',
-            'confidence_sell': 'confidence_sell'
+            'confidence_buy_max': 'confidence_sell'
         })
         # Filtrar apenas quem tem ordem de compra
         df_sell = df_sell[df_sell['sell_price'] > 0]
         
     else:
         # Estratégia: Colocar Sell Order (Trading/Transporte)
+        # Se for vender como Sell Order, a recência do Sell Price também importa
         df_sell = df.rename(columns={
             'city': 'sell_city',
             'sell_price_min': 'sell_price', # Vende competindo com o menor preço de venda
             'timestamp_sell_min': 'timestamp_sell',
-            'confidence_sell': 'confidence_sell'
+            'confidence_sell_min': 'confidence_sell'
         })
 
-    df_sell = df_sell[['item_key', 'sell_city', 'sell_price', 'timestamp_sell', 'confidence_sell']]
+    df_sell = df_sell[['item_key', 'item_id', 'quality', 'sell_city', 'sell_price', 'timestamp_sell', 'confidence_sell']]
 
     # 4. Cruzamento
-    df_arb = pd.merge(df_buy, df_sell, on='item_key')
+    if cross_quality and method == 'instant':
+        df_arb = _match_cross_quality(df_buy, df_sell)
+    else:
+        df_arb = pd.merge(df_buy, df_sell.drop(columns=['item_id', 'quality']), on='item_key')
 
     # 5. Filtros
-    df_arb = df_arb[df_arb['buy_city'] != df_arb['sell_city']]
+    return df_arb[df_arb['buy_city'] != df_arb['sell_city']]
+
+def _match_cross_quality(df_buy: pd.DataFrame, df_sell: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cruzamento entre qualidades: um item comprado na qualidade q pode preencher
+    Buy Orders de qualidade <= q. Em vez de expandir todos os pares de qualidade,
+    guarda por (item, cidade) só os "recordes" de preço em ordem crescente de
+    qualidade (máximo acumulado) e resolve o melhor preço de cada qualidade
+    com merge_asof. O cruzamento final tem o mesmo tamanho do caso normal.
+    """
+    # Código inteiro por (item, cidade): ordenar e agrupar por int é bem mais barato que por texto
+    df_sell = df_sell.assign(
+        quality=df_sell['quality'].astype('int64'),
+        group_id=df_sell.groupby(['item_id', 'sell_city'], sort=False).ngroup()
+    )
+    df_sell = df_sell.sort_values(['group_id', 'quality'], kind='stable')
+
+    # Recorde = preço maior que o de todas as qualidades inferiores na mesma cidade
+    running_max = df_sell.groupby('group_id', sort=False)['sell_price'].cummax()
+    prev_max = running_max.groupby(df_sell['group_id'], sort=False).shift()
+    df_records = df_sell[prev_max.isna() | (df_sell['sell_price'] > prev_max)]
+    df_records = df_records.drop(columns='item_key').rename(columns={'quality': 'sell_quality'})
+
+    # Melhor Buy Order disponível para cada qualidade comprada (máximo do prefixo)
+    df_buy = df_buy.assign(quality=df_buy['quality'].astype('int64'))
+    qualities = pd.DataFrame({'quality': df_buy['quality'].unique()})
+    df_grid = df_records[['group_id']].drop_duplicates().merge(qualities, how='cross')
+
+    df_best = pd.merge_asof(
+        df_grid.sort_values('quality', kind='stable'),
+        df_records.sort_values('sell_quality', kind='stable'),
+        left_on='quality',
+        right_on='sell_quality',
+        by='group_id',
+        direction='backward'
+    )
+    # Sem Buy Order de qualidade <= q naquela cidade
+    df_best = df_best.dropna(subset=['sell_price']).drop(columns='group_id')
+    df_best['sell_quality'] = df_best['sell_quality'].astype('int64')
+
+    return pd.merge(df_buy, df_best, on=['item_id', 'quality'])
+
+def find_arbitrage(df_prices: pd.DataFrame, fee_pct: float, transport_cost: int = 0, top_n: int | None = 50, method: str = 'sell_order', cross_quality: bool = False, as_of: datetime | None = None) -> pd.DataFrame:
+    """
+    Calcula arbitragem com duas estratégias de venda.
+    method: 'instant' (Vende para Buy Order) ou 'sell_order' (Coloca Sell Order).
+    cross_quality: no modo 'instant', permite preencher Buy Orders de qualidade
+    inferior com o item comprado (ex: Q3 vendido para uma Buy Order Q1).
+    as_of: momento de referência da confiança (padrão: agora; usado no backtest).
+    top_n: None retorna todas as oportunidades.
+    """
+    if df_prices.empty:
+        return pd.DataFrame()
+
+    df = _prepare_prices(df_prices, as_of)
+
+    if df.empty:
+        return pd.DataFrame()
+
+    df_arb = _join_sides(df, method, cross_quality)
 
     # 6. Cálculos
     df_arb['gross_profit'] = df_arb['sell_price'] - df_arb['buy_price']
@@ -100,12 +171,82 @@ def find_arbitrage(df_prices: pd.DataFrame, fee_pct: float, transport_cost: int
     df_arb['profit_pct'] = (df_arb['net_profit'] / df_arb['buy_price']) * 100.0
     df_arb['confidence_score'] = (df_arb['confidence_buy'] + df_arb['confidence_sell']) / 2.0
     
-    df_final = df_arb[[
+    cols_final = [
         'item_key', 'buy_city', 'sell_city', 'buy_price', 'sell_price',
         'gross_profit', 'net_profit', 'profit_pct', 'confidence_score',
         'timestamp_buy', 'timestamp_sell'
-    ]]
+    ]
+    if 'sell_quality' in df_arb.columns:
+        # Qualidade da Buy Order preenchida (pode ser menor que a do item comprado)
+        cols_final.append('sell_quality')
+
+    df_final = df_arb[cols_final]
     
     df_final = df_final.rename(columns={'item_key': 'item_id_quality'})
 
-    return df_final.sort_values(by='net_profit', ascending=False).head(top_n).reset_index(drop=True)
\ No newline at end of file
+    df_final = df_final.sort_values(by='net_profit', ascending=False)
+    if top_n is not None:
+        df_final = df_final.head(top_n)
+
+    return df_final.reset_index(drop=True)
+
+def sweep_arbitrage(df_prices: pd.DataFrame, fee_values: list[float], transport_values: list[int], methods: tuple[str, ...] = ('sell_order', 'instant'), min_profit_pct: float = 0.0, cross_quality: bool = False) -> pd.DataFrame:
+    """
+    Análise de sensibilidade: avalia todas as combinações de taxa, transporte e
+    estratégia de uma vez. A limpeza é feita uma única vez e o cruzamento uma vez
+    por estratégia; a grade de lucro é calculada por broadcasting (numpy).
+    Retorna uma linha por (method, fee_pct, transport_cost) com o número de
+    oportunidades e o melhor lucro/ROI.
+    """
+    if df_prices.empty or not fee_values or not transport_values:
+        return pd.DataFrame()
+
+    df = _prepare_prices(df_prices)
+
+    if df.empty:
+        return pd.DataFrame()
+
+    fees = np.asarray(fee_values, dtype=float)
+    transports = np.asarray(transport_values, dtype=float)
+    fee_multipliers = 1.0 - (fees / 100.0)
+    min_ratio = min_profit_pct / 100.0
+
+    results = []
+    for method in methods:
+        df_arb = _join_sides(df, method, cross_quality)
+        buy = df_arb['buy_price'].to_numpy(dtype=float)
+        sell = df_arb['sell_price'].to_numpy(dtype=float)
+
+        # Descarta de cara o que não dá lucro nem no cenário mais favorável
+        best_case = sell * fee_multipliers.max() - buy - transports.min()
+        viable = (best_case > 0) & (best_case >= buy * min_ratio)
+        buy, sell = buy[viable], sell[viable]
+
+        count = np.zeros((len(fees), len(transports)), dtype=int)
+        best_net = np.full((len(fees), len(transports)), -np.inf)
+        best_pct = np.full((len(fees), len(transports)), -np.inf)
+
+        chunk = max(1, SWEEP_CHUNK_CELLS // (len(fees) * len(transports)))
+        for i in range(0, len(buy), chunk):
+            b = buy[i:i + chunk, None, None]
+            s = sell[i:i + chunk, None, None]
+
+            # Grade (linhas, taxas, transportes)
+            net = s * fee_multipliers[None, :, None] - b - transports[None, None, :]
+            ok = (net > 0) & (net >= b * min_ratio)
+
+            count += ok.sum(axis=0)
+            best_net = np.maximum(best_net, np.where(ok, net, -np.inf).max(axis=0))
+            best_pct = np.maximum(best_pct, np.where(ok, net / b * 100.0, -np.inf).max(axis=0))
+
+        grid_fee, grid_transport = np.meshgrid(fees, transports, indexing='ij')
+        results.append(pd.DataFrame({
+            'method': method,
+            'fee_pct': grid_fee.ravel(),
+            'transport_cost': grid_transport.ravel(),
+            'opportunities': count.ravel(),
+            'best_net_profit': np.where(count > 0, best_net, np.nan).ravel(),
+            'best_profit_pct': np.where(count > 0, best_pct, np.nan).ravel()
+        }))
+
+    return pd.concat(results, ignore_index=True)
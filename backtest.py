@@ -0,0 +1,278 @@
+import pandas as pd
+import os
+import json
+import re
+import argparse
+from datetime import timedelta
+import arbitrage
+import fetch_prices
+
+# Capturas: um arquivo por coleta da API, com o horário no nome
+# (ex: prices_20251115T200000Z.jsonl). Sem horário no nome, usa a data de modificação.
+# JSON/JSONL aceitam um registro por linha ou a resposta inteira (array) por linha.
+CAPTURE_EXTENSIONS = ('.json', '.jsonl', '.parquet')
+CAPTURE_TIME_PATTERN = re.compile(r'(\d{8})T?(\d{6})')
+
+PRICE_KEYS = ['item_id', 'city', 'quality']
+PRICE_COLS = ['sell_price_min', 'timestamp_sell_min', 'buy_price_max', 'timestamp_buy_max']
+
+def _capture_time(path: str) -> pd.Timestamp:
+    match = CAPTURE_TIME_PATTERN.search(os.path.basename(path))
+    if match:
+        try:
+            return pd.to_datetime(''.join(match.groups()), format='%Y%m%d%H%M%S', utc=True)
+        except ValueError:
+            print(f"AVISO BACKTEST: Horário inválido no nome de '{path}', usando data de modificação.")
+    return pd.Timestamp(os.path.getmtime(path), unit='s', tz='UTC')
+
+def list_captures(directory: str) -> list[tuple[pd.Timestamp, str]]:
+    """
+    Lista as capturas do diretório em ordem cronológica.
+    """
+    paths = [
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.endswith(CAPTURE_EXTENSIONS)
+    ]
+    return sorted((_capture_time(path), path) for path in paths)
+
+def _read_json_records(path: str) -> list[dict]:
+    """
+    Lê respostas da API gravadas em JSON/JSONL. Cada linha (ou o arquivo inteiro)
+    pode ser um registro ou um array de registros (resposta de /stats/prices).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    try:
+        payloads = [json.loads(content)]
+    except json.JSONDecodeError:
+        payloads = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    records = []
+    for payload in payloads:
+        if isinstance(payload, list):
+            records.extend(payload)
+        else:
+            records.append(payload)
+    return records
+
+def load_capture(path: str) -> pd.DataFrame:
+    """
+    Lê uma captura (JSON/JSONL ou Parquet com respostas da API) no schema interno.
+    """
+    try:
+        if path.endswith('.parquet'):
+            df = pd.read_parquet(path) # Requer pyarrow
+        else:
+            df = pd.DataFrame(_read_json_records(path))
+    except (ValueError, ImportError, OSError, TypeError) as e:
+        print(f"ERRO BACKTEST: Falha ao ler captura '{path}': {e}")
+        return pd.DataFrame()
+
+    if df.empty:
+        print(f"AVISO BACKTEST: Captura vazia '{path}'.")
+        return pd.DataFrame()
+
+    missing = [col for col in PRICE_KEYS if col not in df.columns]
+    if missing:
+        print(f"ERRO BACKTEST: Captura '{path}' fora do formato da API (faltam {missing}).")
+        return pd.DataFrame()
+
+    df = fetch_prices.normalize_prices(df)
+    df['quality'] = pd.to_numeric(df['quality'], errors='coerce')
+    df = df.dropna(subset=PRICE_KEYS)
+    df['quality'] = df['quality'].astype(int)
+
+    return df
+
+def _apply_snapshot(state: pd.DataFrame, snapshot: pd.DataFrame) -> tuple[pd.DataFrame, pd.Index]:
+    """
+    Atualiza o estado (último preço por item/cidade/qualidade), como o
+    INSERT OR REPLACE do store, e retorna os itens que mudaram.
+    """
+    snapshot = snapshot.set_index(PRICE_KEYS)[PRICE_COLS]
+    snapshot = snapshot[~snapshot.index.duplicated(keep='last')]
+
+    if state.empty:
+        return snapshot, snapshot.index.get_level_values('item_id').unique()
+
+    previous = state.reindex(snapshot.index)
+    unchanged = (snapshot.eq(previous) | (snapshot.isna() & previous.isna())).all(axis=1)
+    changed_items = snapshot.index[~unchanged].get_level_values('item_id').unique()
+
+    state = pd.concat([state[~state.index.isin(snapshot.index)], snapshot])
+    return state, changed_items
+
+def replay(directory: str, fee_pct: float, transport_cost: int = 0, top_n: int = 50, method: str = 'sell_order', cross_quality: bool = False):
+    """
+    Reproduz as capturas em ordem cronológica, uma de cada vez (streaming).
+    A cada passo gera (captured_at, state, opportunities).
+    Só os itens alterados na captura passam de novo pelo find_arbitrage; os demais
+    reaproveitam o resultado anterior (top_n por item), com a confiança recalculada
+    para o instante atual.
+    """
+    state = pd.DataFrame()
+    cache = pd.DataFrame()
+
+    for captured_at, path in list_captures(directory):
+        snapshot = load_capture(path)
+        if snapshot.empty:
+            continue
+
+        state, changed_items = _apply_snapshot(state, snapshot)
+
+        if len(changed_items) > 0:
+            in_changed = state.index.get_level_values('item_id').isin(changed_items)
+            fresh = arbitrage.find_arbitrage(
+                state[in_changed].reset_index(),
+                fee_pct=fee_pct,
+                transport_cost=transport_cost,
+                top_n=None,
+                method=method,
+                cross_quality=cross_quality,
+                as_of=captured_at
+            )
+            if not fresh.empty:
+                # Split só nas chaves distintas, não linha a linha
+                codes, item_keys = pd.factorize(fresh['item_id_quality'])
+                fresh['item_id'] = pd.Index(item_keys).str.rsplit('_Q', n=1).str[0].to_numpy()[codes]
+                # O top_n global sempre está contido no top_n de cada item
+                fresh = fresh.groupby('item_id', sort=False).head(top_n)
+            if not cache.empty:
+                cache = cache[~cache['item_id'].isin(changed_items)]
+            cache = pd.concat([cache, fresh], ignore_index=True)
+
+        if cache.empty:
+            yield captured_at, state, pd.DataFrame()
+            continue
+
+        opportunities = cache.copy()
+        opportunities['confidence_score'] = (
+            arbitrage.compute_confidence(opportunities['timestamp_buy'], captured_at)
+            + arbitrage.compute_confidence(opportunities['timestamp_sell'], captured_at)
+        ) / 2.0
+        opportunities = opportunities.sort_values(by='net_profit', ascending=False).head(top_n)
+
+        yield captured_at, state, opportunities.reset_index(drop=True)
+
+def _resolve(pending: pd.DataFrame, state: pd.DataFrame, fee_pct: float, transport_cost: int, method: str) -> pd.DataFrame:
+    """
+    Confronta oportunidades com o preço vigente na chegada (join as-of: o estado
+    é a última captura anterior ao horário de chegada).
+    """
+    price_col = 'buy_price_max' if method == 'instant' else 'sell_price_min'
+
+    # Com cross_quality a venda é na qualidade da Buy Order preenchida
+    if 'sell_quality' in pending.columns:
+        quality = pending['sell_quality']
+    else:
+        quality = pending['item_id_quality'].str.rsplit('_Q', n=1).str[1]
+    keys = pd.MultiIndex.from_arrays(
+        [pending['item_id'], pending['sell_city'], quality.astype(int)],
+        names=PRICE_KEYS
+    )
+
+    realized = pd.to_numeric(state[price_col].reindex(keys), errors='coerce').to_numpy()
+
+    resolved = pending.copy()
+    resolved['realized_sell_price'] = realized
+    # Sem ordem na chegada = sem venda
+    resolved.loc[resolved['realized_sell_price'] <= 0, 'realized_sell_price'] = float('nan')
+
+    fee_multiplier = 1.0 - (fee_pct / 100.0)
+    resolved['realized_net_profit'] = (resolved['realized_sell_price'] * fee_multiplier) - resolved['buy_price'] - transport_cost
+
+    return resolved
+
+def run_backtest(directory: str, fee_pct: float, transport_cost: int = 0, top_n: int = 50, method: str = 'sell_order', cross_quality: bool = False, horizon_hours: float = 1.0) -> pd.DataFrame:
+    """
+    Backtest: emite oportunidades a cada captura e mede, horizon_hours depois
+    (tempo de viagem), o lucro realizado vs. previsto.
+    Oportunidades cuja chegada passa da última captura são descartadas.
+    """
+    horizon = timedelta(hours=horizon_hours)
+    pending = pd.DataFrame()
+    resolved = []
+    prev_state = None
+    last_captured_at = None
+
+    for captured_at, state, opportunities in replay(directory, fee_pct, transport_cost, top_n, method, cross_quality):
+        # Chegadas antes desta captura usam o estado anterior
+        if prev_state is not None and not pending.empty:
+            due = pending['due_at'] < captured_at
+            if due.any():
+                resolved.append(_resolve(pending[due], prev_state, fee_pct, transport_cost, method))
+                pending = pending[~due]
+
+        if not opportunities.empty:
+            opportunities['emitted_at'] = captured_at
+            opportunities['due_at'] = captured_at + horizon
+            pending = pd.concat([pending, opportunities], ignore_index=True)
+
+        prev_state = state
+        last_captured_at = captured_at
+
+    if prev_state is not None and not pending.empty:
+        due = pending['due_at'] <= last_captured_at
+        if due.any():
+            resolved.append(_resolve(pending[due], prev_state, fee_pct, transport_cost, method))
+
+    if not resolved:
+        return pd.DataFrame()
+
+    return pd.concat(resolved, ignore_index=True)
+
+def summarize_backtest(df_resolved: pd.DataFrame) -> dict:
+    """
+    Resumo do backtest: quantas oportunidades se mantiveram e quanto do lucro previsto se realizou.
+    Ordens que sumiram até a chegada contam como lucro realizado 0.
+    """
+    if df_resolved.empty:
+        return {}
+
+    filled = df_resolved['realized_net_profit'].notna()
+    predicted = df_resolved['net_profit'].sum()
+    realized = df_resolved['realized_net_profit'].fillna(0).sum()
+    predicted_filled = df_resolved.loc[filled, 'net_profit'].sum()
+
+    return {
+        'opportunities': len(df_resolved),
+        'filled': int(filled.sum()),
+        'vanished': int((~filled).sum()),
+        'still_profitable': int((df_resolved['realized_net_profit'] > 0).sum()),
+        'predicted_profit': predicted,
+        'realized_profit': realized,
+        'realization_pct': (realized / predicted * 100.0) if predicted else float('nan'),
+        # Só entre as ordens que ainda existiam na chegada
+        'filled_realization_pct': (df_resolved.loc[filled, 'realized_net_profit'].sum() / predicted_filled * 100.0) if predicted_filled else float('nan')
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest de arbitragem sobre capturas gravadas da API.")
+    parser.add_argument("directory", help="Diretório com capturas .json/.jsonl/.parquet")
+    parser.add_argument("--fee", type=float, default=4.5, help="Taxa de mercado (%%)")
+    parser.add_argument("--transport", type=int, default=0, help="Custo de transporte")
+    parser.add_argument("--method", choices=['sell_order', 'instant'], default='sell_order')
+    parser.add_argument("--cross-quality", action='store_true', help="Preencher Buy Orders de qualidade inferior (instant)")
+    parser.add_argument("--top", type=int, default=50, help="Oportunidades emitidas por captura")
+    parser.add_argument("--horizon", type=float, default=1.0, help="Horas até chegar ao destino")
+    parser.add_argument("--output", help="CSV com as oportunidades resolvidas")
+    args = parser.parse_args()
+
+    result = run_backtest(
+        args.directory,
+        fee_pct=args.fee,
+        transport_cost=args.transport,
+        top_n=args.top,
+        method=args.method,
+        cross_quality=args.cross_quality,
+        horizon_hours=args.horizon
+    )
+
+    if result.empty:
+        print("Nenhuma oportunidade resolvida.")
+    else:
+        for key, value in summarize_backtest(result).items():
+            print(f"{key}: {value}")
+        if args.output:
+            result.to_csv(args.output, index=False)
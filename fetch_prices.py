@@ -38,6 +38,40 @@ def load_sample_data(filepath: str = 'sample_data.json') -> pd.DataFrame:
         print(f"ERRO: Falha ao processar sample data: {e}")
         return pd.DataFrame()
 
+def normalize_prices(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte uma resposta da API de preços (já em DataFrame) para o schema interno.
+    Usado tanto na busca ao vivo quanto na leitura de capturas gravadas (backtest).
+    """
+    # --- Normalização e Limpeza ---
+    # Mapeamento para nomes de colunas internos do projeto
+    df = df.rename(columns={
+        'sell_price_min_date': 'timestamp_sell_min',
+        'buy_price_max_date': 'timestamp_buy_max'
+    })
+    
+    # Enriquecimento de dados
+    df['tier'] = df['item_id'].str.extract(r'T(\d)')[0].fillna(0).astype(int)
+    
+    # Garantia de Schema (Cols obrigatórias)
+    expected_cols = [
+        'item_id', 'city', 'quality', 
+        'sell_price_min', 'timestamp_sell_min',
+        'buy_price_max', 'timestamp_buy_max',
+        'tier'
+    ]
+    
+    # Preenche colunas faltantes caso a API mude o formato
+    for col in expected_cols:
+        if col not in df.columns:
+            df[col] = None
+
+    # Tratamento de datas nulas da API
+    df['timestamp_sell_min'] = df['timestamp_sell_min'].replace(NULL_TIMESTAMP, pd.NaT)
+    df['timestamp_buy_max'] = df['timestamp_buy_max'].replace(NULL_TIMESTAMP, pd.NaT)
+
+    return df[expected_cols]
+
 def fetch_prices_real(items: list[str], cities: list[str], qualities: list[int]) -> pd.DataFrame:
     """
     Busca preços atuais na API pública do Albion Data Project.
@@ -69,36 +103,7 @@ def fetch_prices_real(items: list[str], cities: list[str], qualities: list[int])
             print("API: Nenhum dado retornado para os filtros selecionados.")
             return pd.DataFrame()
 
-        # --- Normalização e Limpeza ---
-        df = pd.DataFrame(data)
-        
-        # Mapeamento para nomes de colunas internos do projeto
-        df = df.rename(columns={
-            'sell_price_min_date': 'timestamp_sell_min',
-            'buy_price_max_date': 'timestamp_buy_max'
-        })
-        
-        # Enriquecimento de dados
-        df['tier'] = df['item_id'].str.extract(r'T(\d)')[0].fillna(0).astype(int)
-        
-        # Tratamento de datas nulas da API
-        df['timestamp_sell_min'] = df['timestamp_sell_min'].replace(NULL_TIMESTAMP, pd.NaT)
-        df['timestamp_buy_max'] = df['timestamp_buy_max'].replace(NULL_TIMESTAMP, pd.NaT)
-
-        # Garantia de Schema (Cols obrigatórias)
-        expected_cols = [
-            'item_id', 'city', 'quality', 
-            'sell_price_min', 'timestamp_sell_min',
-            'buy_price_max', 'timestamp_buy_max',
-            'tier'
-        ]
-        
-        # Preenche colunas faltantes caso a API mude o formato
-        for col in expected_cols:
-            if col not in df.columns:
-                df[col] = None
-
-        return df[expected_cols]
+        return normalize_prices(pd.DataFrame(data))
     except requests.Timeout:
         print("ERRO API: Timeout na conexão (servidor demorou a responder).")
         return pd.DataFrame()